@@ -13,19 +13,34 @@
 
 
 import requests
+from requests.adapters import HTTPAdapter
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
 import os
+import openpyxl
 from openpyxl import load_workbook, Workbook 
-from openpyxl.utils.dataframe import dataframe_to_rows
 from openpyxl.utils import get_column_letter 
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side 
+from openpyxl.styles import Font, PatternFill, Alignment, Border, Side, NamedStyle 
 from openpyxl.chart import LineChart, Reference 
 from openpyxl.formatting.rule import ColorScaleRule 
 import pytz
 import time
 import random
 import traceback 
+import threading
+import hashlib
+import json
+import functools
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+try:
+    import orjson # Optional: parses API payloads 2-5x faster than the stdlib json module
+    json_loads, json_dumps = orjson.loads, orjson.dumps
+except ImportError:
+    json_loads, json_dumps = json.loads, lambda obj: json.dumps(obj).encode()
 
 # --- Configuration ---
 # Portfolio coins to track (modify as needed)
@@ -45,14 +60,29 @@ HISTORY_COIN_IDS = {
 HISTORICAL_DAYS = 30 # For 1 month history
 
 # --- API Rate Limit Delay & Retry ---
-INITIAL_API_CALL_DELAY_SECONDS = 5 # Initial delay between consecutive API calls
+INITIAL_API_CALL_DELAY_SECONDS = 5 # First backoff delay after a 429 without Retry-After
 MAX_RETRIES = 5                    # Max number of retries for an API call
 BACKOFF_FACTOR = 2                 # Factor by which to increase delay (e.g., 2s, 4s, 8s...)
+MAX_CONCURRENT_REQUESTS = 4        # Max API calls in flight at once (keeps us under CoinGecko's per-minute quota)
+MIN_CALL_INTERVAL_SECONDS = 5      # Sustained pace per host: one call every this many seconds (~12/min), unless the host's X-RateLimit headers say otherwise
+RATE_LIMIT_BURST = 3               # Calls per host allowed back to back before that pacing kicks in
+REQUEST_TIMEOUT_SECONDS = (5, 20)  # (connect, read) timeout so a stalled connection can't hang the run
 
 # --- Google Drive Path Configuration ---
 GOOGLE_DRIVE_FOLDER = '/content/drive/My Drive/Crypto_Portfolio_Data'
 EXCEL_FILE_NAME = os.path.join(GOOGLE_DRIVE_FOLDER, 'crypto_portfolio.xlsx')
 
+# --- Response Cache Configuration ---
+# API responses are cached on disk so repeat runs skip endpoints whose data is still fresh
+HTTP_CACHE_FOLDER = os.path.join(GOOGLE_DRIVE_FOLDER, '.http_cache')
+CACHE_TTL_SECONDS = {
+    'current_prices': 60,           # Short-lived: only spares back-to-back re-runs
+    'historical': 12 * 60 * 60,     # Daily history barely changes between runs
+    'market_overview': 5 * 60,
+    'global_metrics': 15 * 60,
+    'fear_greed_index': 60 * 60     # Index is only published once a day
+}
+
 DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
 IST = pytz.timezone('Asia/Kolkata')
 
@@ -88,19 +118,126 @@ COLORS = {
     'neutral': 'FF9CB4D8',
     'background': 'FFF2F2F2'
 }
+# openpyxl pads 6-char codes with a 00 alpha, which makes fills transparent - keep every entry 'FF' + RRGGBB
+assert all(len(v) == 8 for v in COLORS.values()), "COLORS entries must be 8-char ARGB codes"
+
+# --- Shared Cell Styles ---
+# Built once and reused everywhere, so openpyxl's style table dedups to a handful of entries
+HEADER_FONT = Font(bold=True, color='FFFFFFFF') # 8-char ARGB: a 6-char code gets a 00 (transparent) alpha
+HEADER_FILL = PatternFill(start_color=COLORS['header'], end_color=COLORS['header'], fill_type='solid')
+CENTER_ALIGNMENT = Alignment(horizontal='center')
+BOLD_FONT = Font(bold=True)
+TITLE_FONT = Font(size=20, bold=True, color=COLORS['header'])
+SUBTITLE_FONT = Font(size=12, italic=True)
+SECTION_FONT = Font(size=14, bold=True)
+GREEN_FILL = PatternFill(start_color='FF00FF00', end_color='FF00FF00', fill_type='solid')
+RED_FILL = PatternFill(start_color='FFFF0000', end_color='FFFF0000', fill_type='solid')
+YELLOW_FILL = PatternFill(start_color='FFFFFF00', end_color='FFFFFF00', fill_type='solid')
+
+# Named number styles for the history sheets: registered once per workbook, so each cell just
+# points at a style by name instead of resolving its own number format
+HISTORY_NAMED_STYLES = [
+    NamedStyle(name='price4', number_format='#,##0.0000'), # High precision for price/MA
+    NamedStyle(name='int0', number_format='#,##0'),        # Integer formatting for volume/market cap
+    NamedStyle(name='pct3', number_format='0.000%')        # Percentage formatting for returns/volatility
+]
+
+# --- Rate Limiter Shared by All API Calls ---
+class RateLimiter:
+    """
+    Thread-safe token bucket for outgoing API calls, kept per host.
+    Each host allows `burst` calls back to back, then refills at one call per `interval`
+    seconds, and at most `max_concurrent` requests are in flight overall. When a host
+    answers 429, `pause` holds back every pending call to that host, not just the one
+    that got rate limited. Hosts that report their remaining budget in X-RateLimit-*
+    headers get their interval re-derived from it by `observe`.
+    """
+    def __init__(self, max_concurrent, interval, burst):
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._interval = interval
+        self._burst = burst
+        self._intervals = {} # host -> interval learned from its rate-limit headers
+        # host -> time.monotonic() at which its bucket is full again ("theoretical arrival time");
+        # a call may start once now >= that time minus the burst allowance
+        self._full_at = {}
+
+    def _pace(self, host):
+        """(interval, burst allowance) for host; call with the lock held."""
+        interval = self._intervals.get(host, self._interval)
+        return interval, (self._burst - 1) * interval
+
+    @contextmanager
+    def slot(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            interval, burst_allowance = self._pace(host)
+            now = time.monotonic()
+            full_at = max(now, self._full_at.get(host, now))
+            start = max(now, full_at - burst_allowance)
+            self._full_at[host] = full_at + interval # Take a token
+        if start > now:
+            time.sleep(start - now) # Wait for our token before taking an in-flight slot, so other hosts aren't blocked
+        with self._slots:
+            yield
+
+    def pause(self, url, seconds):
+        host = urlparse(url).netloc
+        with self._lock:
+            # Empty the bucket until `seconds` from now; calls then resume one per interval
+            resume_at = time.monotonic() + seconds + self._pace(host)[1]
+            self._full_at[host] = max(self._full_at.get(host, resume_at), resume_at)
+
+    def observe(self, url, headers):
+        """
+        Spreads the host's remaining calls evenly over the time left until its quota resets,
+        using the X-RateLimit-Remaining / X-RateLimit-Reset response headers. A fresh budget
+        paces calls faster than `interval`, a nearly spent one slower. Hosts that don't send
+        the headers keep the default interval.
+        """
+        try:
+            remaining = int(headers['X-RateLimit-Remaining'])
+            reset = float(headers['X-RateLimit-Reset'])
+        except (KeyError, TypeError, ValueError):
+            return
+        if reset > 1e9: # Sent as an epoch timestamp rather than seconds until reset
+            reset -= time.time()
+        host = urlparse(url).netloc
+        with self._lock:
+            self._intervals[host] = max(reset, 0) / max(remaining, 1)
+
+
+RATE_LIMITER = RateLimiter(MAX_CONCURRENT_REQUESTS, MIN_CALL_INTERVAL_SECONDS, RATE_LIMIT_BURST)
+
+# --- Shared HTTP Session ---
+# One keep-alive connection pool for every call, so each request after the first
+# skips the TCP/TLS handshake. Retries are handled by make_api_call_with_retry.
+HTTP_SESSION = requests.Session()
+HTTP_SESSION.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=MAX_CONCURRENT_REQUESTS, max_retries=0))
+HTTP_SESSION.headers.update({
+    'Accept-Encoding': 'gzip, deflate', # Compressed payloads (market overview shrinks ~5x)
+    'User-Agent': 'crypto-portfolio/1.0'
+})
 
 # --- API Helper Function with Retry Logic ---
-def make_api_call_with_retry(url, params=None, max_retries=MAX_RETRIES, initial_delay=INITIAL_API_CALL_DELAY_SECONDS):
+def make_api_call_with_retry(url, params=None, max_retries=MAX_RETRIES, initial_delay=INITIAL_API_CALL_DELAY_SECONDS, headers=None):
     delay = initial_delay
     for attempt in range(max_retries):
+        response = None
         try:
-            response = requests.get(url, params=params)
+            with RATE_LIMITER.slot(url):
+                response = HTTP_SESSION.get(url, params=params, headers=headers, timeout=REQUEST_TIMEOUT_SECONDS)
+            RATE_LIMITER.observe(url, response.headers) # Adapt this host's pacing to its remaining quota
             response.raise_for_status() # Raises HTTPError for bad responses (4xx or 5xx)
             return response
         except requests.exceptions.RequestException as e:
             if response is not None and response.status_code == 429:
-                print(f"  Rate limit hit for {url}. Retrying in {delay:.2f} seconds (Attempt {attempt + 1}/{max_retries})...")
-                time.sleep(delay + random.uniform(0, 1)) # Add some jitter
+                # Honour the server's Retry-After (seconds) when present, else exponential backoff
+                retry_after = response.headers.get('Retry-After')
+                wait = float(retry_after) if retry_after and retry_after.isdigit() else delay
+                wait += random.uniform(0, 1) # Add some jitter
+                print(f"  Rate limit hit for {url}. Retrying in {wait:.2f} seconds (Attempt {attempt + 1}/{max_retries})...")
+                RATE_LIMITER.pause(url, wait) # The next slot() waits it out, along with other threads calling the same host
                 delay *= BACKOFF_FACTOR # Exponential backoff
             else:
                 print(f"  Error during API call for {url}: {e}")
@@ -109,8 +246,136 @@ def make_api_call_with_retry(url, params=None, max_retries=MAX_RETRIES, initial_
     print(f"  Failed to fetch data from {url} after {max_retries} attempts due to rate limits.")
     return None
 
+def cached_api_call(url, params=None, ttl=0):
+    """
+    Returns the parsed JSON body for url/params, served from the on-disk cache while it is
+    younger than `ttl` seconds. Stale entries are revalidated with If-None-Match so the
+    server can answer 304 instead of resending the body. Returns None if the call fails.
+    """
+    cache_key = hashlib.sha256(json.dumps([url, sorted((params or {}).items())]).encode()).hexdigest()
+    cache_file = os.path.join(HTTP_CACHE_FOLDER, f"{cache_key}.json")
+
+    entry = None
+    if os.path.exists(cache_file):
+        try:
+            with open(cache_file, 'rb') as f:
+                entry = json_loads(f.read())
+        except (OSError, ValueError) as e:
+            print(f"  Ignoring unreadable cache entry for {url}: {e}")
+    if entry is not None and time.time() - entry['fetched_at'] < ttl:
+        return entry['body']
+
+    headers = {'If-None-Match': entry['etag']} if entry is not None and entry.get('etag') else None
+    response = make_api_call_with_retry(url, params, headers=headers)
+    if response is None:
+        return None
+
+    if response.status_code == 304 and entry is not None:
+        entry['fetched_at'] = time.time() # Body unchanged, just extend its freshness
+    else:
+        try:
+            body = json_loads(response.content)
+        except ValueError as e:
+            print(f"  Invalid JSON from {url}: {e}. Response: {response.text[:200]}")
+            return None
+        entry = {'fetched_at': time.time(), 'etag': response.headers.get('ETag'), 'body': body}
+
+    try:
+        os.makedirs(HTTP_CACHE_FOLDER, exist_ok=True)
+        tmp_file = f"{cache_file}.tmp"
+        with open(tmp_file, 'wb') as f:
+            f.write(json_dumps(entry))
+        os.replace(tmp_file, cache_file) # Atomic swap so an interrupted run never leaves a half-written entry
+    except OSError as e:
+        print(f"  Could not write cache entry for {url}: {e}")
+    return entry['body']
+
+# --- In-Process Memoization ---
+_MEMO = {}
+_MEMO_LOCK = threading.Lock()
+
+def memoize(func):
+    """
+    Caches a fetcher's result for the rest of the run, keyed by its arguments (lists are
+    frozen to tuples). The in-flight Future is stored, so concurrent duplicate calls share
+    one request. Failed fetches (None or an empty DataFrame) are dropped so a later call
+    can retry. Returned objects are shared - treat them as read-only.
+    """
+    @functools.wraps(func)
+    def wrapper(*args):
+        key = (func.__name__,) + tuple(tuple(a) if isinstance(a, list) else a for a in args)
+        with _MEMO_LOCK:
+            future = _MEMO.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = _MEMO[key] = Future()
+        if is_owner:
+            try:
+                result = func(*args)
+            except BaseException as e:
+                with _MEMO_LOCK:
+                    del _MEMO[key]
+                future.set_exception(e)
+                raise
+            if result is None or (isinstance(result, pd.DataFrame) and result.empty):
+                with _MEMO_LOCK:
+                    del _MEMO[key]
+            future.set_result(result)
+        return future.result()
+    return wrapper
+
+# --- Numeric Helpers for Technical Indicators ---
+
+def _trailing_sums(values, window):
+    """
+    Sum and non-NaN count of each trailing `window` of values. Uses cumulative sums,
+    so the cost stays O(n) however large the window or HISTORICAL_DAYS gets.
+    """
+    valid = ~np.isnan(values)
+    cum_sum = np.concatenate([[0.0], np.cumsum(np.where(valid, values, 0.0))])
+    cum_count = np.concatenate([[0], np.cumsum(valid)])
+    window_start = np.maximum(np.arange(len(values)) + 1 - window, 0)
+    return cum_sum[1:] - cum_sum[window_start], cum_count[1:] - cum_count[window_start]
+
+def rolling_mean(values, window):
+    """NaN-aware trailing mean, same as pandas' rolling(window, min_periods=1).mean()."""
+    sums, counts = _trailing_sums(values, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / counts # All-NaN window -> 0/0 -> NaN
+
+def rolling_std(values, window):
+    """NaN-aware trailing sample std, same as pandas' rolling(window, min_periods=1).std()."""
+    if np.isnan(values).all():
+        return np.full(len(values), np.nan)
+    centered = values - np.nanmean(values) # Shifting doesn't change the std but keeps the sum of squares well-conditioned
+    sums, counts = _trailing_sums(centered, window)
+    squared_sums, _ = _trailing_sums(centered ** 2, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        variance = (squared_sums - sums ** 2 / counts) / (counts - 1)
+        return np.where(counts > 1, np.sqrt(np.maximum(variance, 0)), np.nan) # Needs 2+ points
+
+def compute_indicators(price):
+    """Returns (daily return %, 7-day MA, 30-day MA, 7-day volatility) arrays for a price series."""
+    daily_return = np.full(len(price), np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        daily_return[1:] = (price[1:] / price[:-1] - 1) * 100
+    return daily_return, rolling_mean(price, 7), rolling_mean(price, 30), rolling_std(daily_return, 7)
+
+def _float_array(values):
+    """float64 array from a list of JSON values; None and anything unparseable become NaN."""
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype=np.float64)
+
+def _as_int_column(values):
+    """Truncates floats to int64 like int() does; stays float if any value is missing (NaN)."""
+    truncated = np.trunc(values)
+    return truncated if np.isnan(truncated).any() else truncated.astype(np.int64)
+
 # --- API Functions ---
 
+@memoize
 def fetch_current_coin_prices(coin_ids):
     """Fetches current prices for given coin IDs from CoinGecko API."""
     url = "https://api.coingecko.com/api/v3/simple/price"
@@ -118,14 +383,14 @@ def fetch_current_coin_prices(coin_ids):
         'ids': ','.join(coin_ids),
         'vs_currencies': 'usd'
     }
-    response = make_api_call_with_retry(url, params)
-    if response:
-        data = response.json()
+    data = cached_api_call(url, params, ttl=CACHE_TTL_SECONDS['current_prices'])
+    if data is not None:
         # Ensure prices are stored as float, None if not found
         prices = {coin_id: data.get(coin_id, {}).get('usd') for coin_id in coin_ids}
         return prices
     return None
 
+@memoize
 def get_market_overview():
     """Get comprehensive market overview data (from CryptoExcelGenerator)"""
     base_url = "https://api.coingecko.com/api/v3"
@@ -139,12 +404,9 @@ def get_market_overview():
         'price_change_percentage': '1h,24h,7d,30d,1y'
     }
 
-    response = make_api_call_with_retry(url, params)
-    if response:
-        data = response.json()
-        df = pd.DataFrame(data)
-
-        # Select and rename columns
+    data = cached_api_call(url, params, ttl=CACHE_TTL_SECONDS['market_overview'])
+    if data is not None:
+        # API field -> sheet column
         columns_map = {
             'market_cap_rank': 'Rank',
             'name': 'Name',
@@ -165,35 +427,27 @@ def get_market_overview():
             'atl_date': 'ATL Date'
         }
 
-        df = df.rename(columns=columns_map)
-        df = df[list(columns_map.values())]
-
         # --- CRITICAL CHANGE: Ensure numeric types before putting into Excel ---
-        # Convert numeric columns to appropriate types, handling missing/invalid data
-        numeric_cols_to_convert = {
-            'Price (USD)': float,
-            'Market Cap': float,
-            '24h Volume': float,
-            '24h Change (%)': float,
-            '7d Change (%)': float,
-            '30d Change (%)': float,
-            '1y Change (%)': float,
-            'Circulating Supply': float,
-            'Total Supply': float,
-            'Max Supply': float,
-            'All-Time High': float,
-            'All-Time Low': float
-        }
+        # Pull only the mapped fields out of the payload, with numeric ones going straight into
+        # float64 arrays (JSON null -> NaN), instead of building the full frame and coercing it column by column
+        numeric_cols = [
+            'Price (USD)', 'Market Cap', '24h Volume',
+            '24h Change (%)', '7d Change (%)', '30d Change (%)', '1y Change (%)',
+            'Circulating Supply', 'Total Supply', 'Max Supply',
+            'All-Time High', 'All-Time Low'
+        ]
+        df = pd.DataFrame({
+            col: _float_array([coin.get(field) for coin in data]) if col in numeric_cols else [coin.get(field) for coin in data]
+            for field, col in columns_map.items()
+        })
 
-        for col, dtype in numeric_cols_to_convert.items():
-            if col in df.columns:
-                # Use pd.to_numeric with errors='coerce' to turn unparseable values into NaN
-                df[col] = pd.to_numeric(df[col], errors='coerce').astype(dtype)
-                # Round percentage changes AFTER conversion to float
-                if 'Change (%)' in col:
-                    df[col] = df[col].round(2)
-                elif col == 'Price (USD)':
-                    df[col] = df[col].round(4) # Keep higher precision for price
+        # Round percentage changes, keep higher precision for price
+        for col in ['24h Change (%)', '7d Change (%)', '30d Change (%)', '1y Change (%)']:
+            df[col] = df[col].round(2)
+        df['Price (USD)'] = df['Price (USD)'].round(4)
+        # Whole dollars, as in the history sheets: shorter number tokens in the sheet XML
+        for col in ['Market Cap', '24h Volume']:
+            df[col] = _as_int_column(df[col].to_numpy())
 
         # Convert ATH/ATL dates to datetime objects then format as strings
         for date_col in ['ATH Date', 'ATL Date']:
@@ -211,6 +465,7 @@ def get_market_overview():
     return pd.DataFrame()
 
 
+@memoize
 def get_historical_data(coin_id, days):
     """Fetches daily historical market data (price, market cap, volume) for a coin."""
     base_url = "https://api.coingecko.com/api/v3"
@@ -218,11 +473,11 @@ def get_historical_data(coin_id, days):
     params = {
         'vs_currency': 'usd',
         'days': days,
-        'interval': 'daily'
+        'interval': 'daily', # Keep: without it CoinGecko auto-granularity returns hourly points for 2-90 days
+        'precision': 4       # Prices are rounded to 4 dp below anyway, so don't download the extra digits
     }
-    response = make_api_call_with_retry(url, params)
-    if response:
-        data = response.json()
+    data = cached_api_call(url, params, ttl=CACHE_TTL_SECONDS['historical'])
+    if data is not None:
         prices = data.get('prices', [])
         volumes = data.get('total_volumes', [])
         market_caps = data.get('market_caps', [])
@@ -230,50 +485,38 @@ def get_historical_data(coin_id, days):
         # Ensure all lists have the same length for DataFrame creation
         min_len = min(len(prices), len(volumes), len(market_caps))
 
-        # Extract data and convert to appropriate types, handling potential missing values
-        df = pd.DataFrame({
-            'Date': [datetime.fromtimestamp(p[0]/1000).strftime('%Y-%m-%d') for p in prices[:min_len]],
-            'Price': [round(p[1], 4) if p[1] is not None else None for p in prices[:min_len]],
-            'Volume': [int(v[1]) if v[1] is not None else None for v in volumes[:min_len]],
-            'Market Cap': [int(mc[1]) if mc[1] is not None else None for mc in market_caps[:min_len]]
-        })
-
-        # Calculate technical indicators on numeric columns
-        # Use .copy() to avoid SettingWithCopyWarning
-        df['Price_numeric'] = df['Price'].copy()
-
-        # Only calculate if there's enough data
-        if len(df) > 1:
-            df['Daily Return (%)'] = ((df['Price_numeric'] / df['Price_numeric'].shift(1)) - 1) * 100
-            df['7-Day MA'] = df['Price_numeric'].rolling(window=7, min_periods=1).mean() # min_periods for early rows
-            df['30-Day MA'] = df['Price_numeric'].rolling(window=30, min_periods=1).mean()
-            df['Volatility (7d)'] = df['Daily Return (%)'].rolling(window=7, min_periods=1).std()
-        else:
-            df['Daily Return (%)'] = None
-            df['7-Day MA'] = None
-            df['30-Day MA'] = None
-            df['Volatility (7d)'] = None
+        # Each series is a list of [timestamp_ms, value] pairs; JSON nulls become NaN
+        price_arr = np.asarray(prices[:min_len], dtype=np.float64).reshape(-1, 2)
+        volume_arr = np.asarray(volumes[:min_len], dtype=np.float64).reshape(-1, 2)
+        market_cap_arr = np.asarray(market_caps[:min_len], dtype=np.float64).reshape(-1, 2)
 
-        # Round values
-        df['7-Day MA'] = df['7-Day MA'].round(4)
-        df['30-Day MA'] = df['30-Day MA'].round(4)
-        df['Daily Return (%)'] = df['Daily Return (%)'].round(3)
-        df['Volatility (7d)'] = df['Volatility (7d)'].round(3)
+        # Calculate technical indicators directly on the price array
+        price = price_arr[:, 1].round(4)
+        daily_return, ma_7, ma_30, volatility_7 = compute_indicators(price)
 
-        # Remove helper column
-        df = df.drop('Price_numeric', axis=1)
+        df = pd.DataFrame({
+            'Date': pd.to_datetime(price_arr[:, 0], unit='ms').strftime('%Y-%m-%d').to_numpy(), # Daily points are stamped in UTC
+            'Price': price,
+            'Volume': _as_int_column(volume_arr[:, 1]),
+            'Market Cap': _as_int_column(market_cap_arr[:, 1]),
+            'Daily Return (%)': daily_return.round(3),
+            '7-Day MA': ma_7.round(4),
+            '30-Day MA': ma_30.round(4),
+            'Volatility (7d)': volatility_7.round(3)
+        })
 
         return df
     return pd.DataFrame()
 
 
+@memoize
 def get_fear_greed_index():
     """Fetches the latest Fear & Greed Index data (from CryptoExcelGenerator)."""
     url = "https://api.alternative.me/fng/?limit=30"
-    response = make_api_call_with_retry(url)
-    if response:
+    payload = cached_api_call(url, ttl=CACHE_TTL_SECONDS['fear_greed_index'])
+    if payload is not None:
         try:
-            data = response.json()['data']
+            data = payload['data']
             df = pd.DataFrame(data)
             df['Date'] = pd.to_datetime(df['timestamp'], unit='s', errors='coerce').dt.strftime('%Y-%m-%d')
             # Ensure 'value' is numeric, coerce errors to NaN
@@ -282,7 +525,7 @@ def get_fear_greed_index():
 
             return df[['Date', 'Fear & Greed Index', 'Classification']].sort_values('Date')
         except KeyError as e:
-            print(f"Error parsing Fear & Greed Index data: Missing key {e}. Response: {response.text}")
+            print(f"Error parsing Fear & Greed Index data: Missing key {e}. Response: {payload}")
             traceback.print_exc()
             return pd.DataFrame()
         except Exception as e:
@@ -292,14 +535,15 @@ def get_fear_greed_index():
     return pd.DataFrame()
 
 
+@memoize
 def get_global_metrics():
     """Fetches global cryptocurrency metrics (from CryptoExcelGenerator)."""
     base_url = "https://api.coingecko.com/api/v3"
     url = f"{base_url}/global"
-    response = make_api_call_with_retry(url)
-    if response:
+    payload = cached_api_call(url, ttl=CACHE_TTL_SECONDS['global_metrics'])
+    if payload is not None:
         try:
-            data = response.json()['data']
+            data = payload['data']
             # --- CRITICAL CHANGE: Store raw numeric values, not formatted strings ---
             metrics_data = {
                 'Metric': [
@@ -326,8 +570,7 @@ def get_global_metrics():
             # Ensure numeric types where appropriate
             df['Value'] = pd.to_numeric(df['Value'], errors='coerce') # Coerce non-numeric to NaN
 
-            # You can still add a display column if needed for string formatting for the dashboard directly
-            # but the underlying 'Value' should remain numeric for Power BI
+            # Display strings for the Executive Dashboard; the underlying 'Value' stays numeric for Power BI
             def format_global_metric(row):
                 if pd.isna(row['Value']):
                     return "N/A"
@@ -340,16 +583,70 @@ def get_global_metrics():
 
             df['Formatted Value'] = df.apply(format_global_metric, axis=1)
 
-            # Return 'Metric' and 'Value' for Power BI (or 'Formatted Value' if you prefer text in Excel directly)
-            # For Power BI, it's generally better to pass 'Value' as numeric and let Power BI format.
-            return df[['Metric', 'Value']] # Pass raw numeric value to Excel
+            # Only 'Metric' and the raw numeric 'Value' go to the Global Metrics sheet (Power BI formats it);
+            # 'Formatted Value' is reused by the dashboard so the formatting lives in one place
+            return df[['Metric', 'Value', 'Formatted Value']]
         except Exception as e:
-            print(f"Error parsing global market data: {e}. Response: {response.text}")
+            print(f"Error parsing global market data: {e}. Response: {payload}")
             traceback.print_exc() # Print full traceback for debugging
             return pd.DataFrame()
     return pd.DataFrame()
 
 
+# --- Excel Helper Functions ---
+
+def write_dataframe(ws, df):
+    """
+    Writes df to an empty worksheet as a styled header row followed by one row per record.
+    Whole rows go through ws.append, which skips the per-cell coordinate lookups of ws.cell().
+    """
+    ws.append(df.columns.tolist())
+    for row in df.itertuples(index=False, name=None):
+        ws.append(row)
+
+    for cell in ws[1]:
+        cell.font = HEADER_FONT
+        cell.fill = HEADER_FILL
+
+
+def recreate_sheet(wb, sheet_name):
+    """
+    Replaces sheet_name with an empty sheet at the same position and returns it.
+    For sheets rewritten from scratch this is cheaper than delete_rows (which re-keys every
+    remaining cell), and it drops last run's charts and conditional formats instead of
+    stacking new ones on top of them.
+    """
+    sheet_index = wb.sheetnames.index(sheet_name)
+    del wb[sheet_name]
+    return wb.create_sheet(sheet_name, sheet_index)
+
+
+def column_widths(df, max_width=30):
+    """
+    Auto-fit column widths from the longest header or value text in each column (+2 padding),
+    capped at max_width. Measured on the DataFrame instead of walking cells; numbers are measured
+    with thousands separators, as the sheet's number formats display them.
+    """
+    def text_lengths(col):
+        text = col.map('{:,}'.format) if pd.api.types.is_numeric_dtype(col) else col.astype(str)
+        return text.str.len().max()
+
+    header_lengths = df.columns.to_series().astype(str).str.len().to_numpy()
+    value_lengths = df.apply(text_lengths).fillna(0).to_numpy()
+    return [int(w) for w in np.minimum(np.maximum(header_lengths, value_lengths) + 2, max_width)]
+
+
+def history_style_name(header_name):
+    """Name of the HISTORY_NAMED_STYLES entry for a history column, or None to leave it unformatted."""
+    if header_name == 'Price' or header_name.endswith('MA'):
+        return 'price4'
+    if header_name in ('Volume', 'Market Cap'):
+        return 'int0'
+    if header_name in ('Daily Return (%)', 'Volatility (7d)'):
+        return 'pct3'
+    return None
+
+
 def create_or_update_excel(all_data, excel_file):
     """
     Creates/updates the Excel file with data for all specified sheets.
@@ -395,6 +692,9 @@ def create_or_update_excel(all_data, excel_file):
                 ws = wb[sheet_name] # Ensure we're working on the right sheet object
                 # Updated headers to reflect the expected input from the script (Current Value (USD) is current price)
                 ws.append(['Coin ID', 'Current Value (USD)', 'Purchase Price (USD)', 'Quantity', 'P/L (USD)', 'P/L Ratio', 'Total Value (USD)', 'Symbol', 'Location', 'AirDrop or Invest'])
+                for cell in ws[1]:
+                    cell.font = HEADER_FONT
+                    cell.fill = HEADER_FILL
                 ws.column_dimensions['A'].width = 15
                 ws.column_dimensions['B'].width = 20
                 ws.column_dimensions['C'].width = 20
@@ -407,45 +707,34 @@ def create_or_update_excel(all_data, excel_file):
                 ws.column_dimensions['J'].width = 10
 
 
+    # Named styles are saved with the workbook, so only register the ones it doesn't have yet
+    for named_style in HISTORY_NAMED_STYLES:
+        if named_style.name not in wb.named_styles:
+            wb.add_named_style(named_style)
+
     # --- Update each sheet ---
 
     # 1. Executive Dashboard
-    ws_exec_dash = wb[EXECUTIVE_DASHBOARD_SHEET_NAME]
-    ws_exec_dash.delete_rows(1, ws_exec_dash.max_row) # Clear existing content
+    ws_exec_dash = recreate_sheet(wb, EXECUTIVE_DASHBOARD_SHEET_NAME) # Start from a blank sheet
 
     ws_exec_dash['A1'] = "Cryptocurrency Market Dashboard"
-    ws_exec_dash['A1'].font = Font(size=20, bold=True, color=COLORS['header'])
+    ws_exec_dash['A1'].font = TITLE_FONT
     ws_exec_dash.merge_cells('A1:H1')
 
     ws_exec_dash['A3'] = f"Generated: {current_time_ist}"
-    ws_exec_dash['A3'].font = Font(size=12, italic=True)
+    ws_exec_dash['A3'].font = SUBTITLE_FONT
 
     # Key metrics section
     ws_exec_dash['A5'] = "🔑 Key Market Metrics"
-    ws_exec_dash['A5'].font = Font(size=14, bold=True)
+    ws_exec_dash['A5'].font = SECTION_FONT
 
     global_metrics_df = all_data.get('global_metrics')
     if global_metrics_df is not None and not global_metrics_df.empty:
-        # Re-apply string formatting for display in the dashboard sheet
-        display_metrics_data = {
-            'Metric': [],
-            'Value': []
-        }
-        for _, row in global_metrics_df.iterrows():
-            display_metrics_data['Metric'].append(row['Metric'])
-            if pd.isna(row['Value']):
-                display_metrics_data['Value'].append("N/A")
-            elif '%' in row['Metric']:
-                display_metrics_data['Value'].append(f"{row['Value']:.2f}%")
-            elif 'USD' in row['Metric']:
-                display_metrics_data['Value'].append(f"${row['Value']:,.0f}")
-            else:
-                display_metrics_data['Value'].append(f"{int(row['Value']):,}")
-
-        for i, (metric, value) in enumerate(zip(display_metrics_data['Metric'], display_metrics_data['Value']), start=6):
+        metric_rows = global_metrics_df[['Metric', 'Formatted Value']].itertuples(index=False, name=None)
+        for i, (metric, value) in enumerate(metric_rows, start=6):
             ws_exec_dash[f'A{i}'] = metric
             ws_exec_dash[f'B{i}'] = value
-            ws_exec_dash[f'A{i}'].font = Font(bold=True)
+            ws_exec_dash[f'A{i}'].font = BOLD_FONT
         # Apply auto-width for these columns as well
         ws_exec_dash.column_dimensions['A'].width = 25
         ws_exec_dash.column_dimensions['B'].width = 25
@@ -455,7 +744,7 @@ def create_or_update_excel(all_data, excel_file):
 
     # Market sentiment section
     ws_exec_dash['D5'] = "😰 Market Sentiment"
-    ws_exec_dash['D5'].font = Font(size=14, bold=True)
+    ws_exec_dash['D5'].font = SECTION_FONT
 
     fng_df = all_data.get('fear_greed_index')
     if fng_df is not None and not fng_df.empty:
@@ -470,64 +759,42 @@ def create_or_update_excel(all_data, excel_file):
         # Color code based on sentiment, check if fng_value is not NaN
         if pd.notna(fng_value):
             if fng_value > 75:
-                ws_exec_dash['D7'].fill = PatternFill(start_color='FF00FF00', end_color='FF00FF00', fill_type='solid') # Green for Extreme Greed
+                ws_exec_dash['D7'].fill = GREEN_FILL # Green for Extreme Greed
             elif fng_value < 25:
-                ws_exec_dash['D7'].fill = PatternFill(start_color='FFFF0000', end_color='FFFF0000', fill_type='solid') # Red for Extreme Fear
+                ws_exec_dash['D7'].fill = RED_FILL # Red for Extreme Fear
             else:
-                ws_exec_dash['D7'].fill = PatternFill(start_color='FFFFFF00', end_color='FFFFFF00', fill_type='solid') # Yellow for Neutral
+                ws_exec_dash['D7'].fill = YELLOW_FILL # Yellow for Neutral
     else:
         ws_exec_dash['D6'] = "Unable to fetch sentiment data"
 
     # 2. Market Overview Sheet
     market_overview_df = all_data.get('market_overview')
     if market_overview_df is not None and not market_overview_df.empty:
-        ws_market_overview = wb[MARKET_OVERVIEW_SHEET_NAME]
-        ws_market_overview.delete_rows(1, ws_market_overview.max_row) # Clear existing content
-
-        # Write header row
-        ws_market_overview.append(market_overview_df.columns.tolist())
-
-        # Write data rows
-        for r_idx, r in enumerate(dataframe_to_rows(market_overview_df, index=False, header=False)): # header=False as we added it manually
-            for c_idx, value in enumerate(r):
-                ws_market_overview.cell(row=r_idx + 2, column=c_idx + 1, value=value) # Start from row 2
-
-        # Apply formatting (from your CryptoExcelGenerator class)
-        header_font = Font(bold=True, color='FFFFFF')
-        header_fill = PatternFill(start_color=COLORS['header'], end_color=COLORS['header'], fill_type='solid')
-
-        for cell in ws_market_overview[1]: # Apply to the manually added header row
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = Alignment(horizontal='center')
-
-        # Apply alignment and basic coloring to data rows
-        for row_idx in range(2, ws_market_overview.max_row + 1):
-            for col_idx in range(1, ws_market_overview.max_column + 1):
-                cell = ws_market_overview.cell(row=row_idx, column=col_idx)
-                cell.alignment = Alignment(horizontal='center')
-
-                # Apply numeric formatting for currency columns
-                header_name = ws_market_overview.cell(row=1, column=col_idx).value
-                if header_name in ['Price (USD)', 'Market Cap', '24h Volume', 'All-Time High', 'All-Time Low']:
-                    if cell.value is not None:
-                        cell.number_format = '$#,##0.00' if 'Price' in header_name else '$#,##0'
-                elif 'Change (%)' in header_name:
-                    if cell.value is not None:
-                        cell.number_format = '0.00%' # Format as percentage
-
-                # Color code percentage changes (background fill)
-                if header_name in ['24h Change (%)', '7d Change (%)', '30d Change (%)', '1y Change (%)']:
-                    try:
-                        value = float(cell.value)
-                        if value > 0:
-                            cell.fill = PatternFill(start_color='FFE6F3E6', end_color='FFE6F3E6', fill_type='solid') # Light Green
-                        elif value < 0:
-                            cell.fill = PatternFill(start_color='FFFFE6E6', end_color='FFFFE6E6', fill_type='solid') # Light Red
-                    except (ValueError, TypeError):
-                        pass # Handle non-numeric or None values
-
-        # Add conditional formatting for price changes (full range of data)
+        ws_market_overview = recreate_sheet(wb, MARKET_OVERVIEW_SHEET_NAME)
+
+        write_dataframe(ws_market_overview, market_overview_df)
+
+        for cell in ws_market_overview[1]: # Header row is also centered here
+            cell.alignment = CENTER_ALIGNMENT
+
+        # Decide each column's number format once from its header, not per cell
+        number_formats = {}
+        for header_name in market_overview_df.columns:
+            if header_name in ['Price (USD)', 'Market Cap', '24h Volume', 'All-Time High', 'All-Time Low']:
+                number_formats[header_name] = '$#,##0.00' if 'Price' in header_name else '$#,##0'
+            elif 'Change (%)' in header_name:
+                number_formats[header_name] = '0.00%' # Format as percentage
+
+        # Apply alignment and number formats one column at a time
+        for header_name, column_cells in zip(market_overview_df.columns, ws_market_overview.iter_cols(min_row=2)):
+            number_format = number_formats.get(header_name)
+            for cell in column_cells:
+                cell.alignment = CENTER_ALIGNMENT
+                if number_format:
+                    cell.number_format = number_format
+
+        # Color code percentage changes with one conditional formatting rule over the 24h-1y columns;
+        # Excel colors the cells when rendering, so no per-cell fills are written
         # Find column indices for percentage change columns
         header_row_values = [cell.value for cell in ws_market_overview[1]]
         try:
@@ -549,50 +816,21 @@ def create_or_update_excel(all_data, excel_file):
             print("Warning: One or more percentage change columns not found for conditional formatting in Market Overview.")
 
         # Auto-adjust column widths for Market Overview
-        for col_idx in range(1, ws_market_overview.max_column + 1):
-            max_length = 0
-            column_letter = get_column_letter(col_idx)
-            for row in ws_market_overview.iter_rows(min_row=1, max_row=ws_market_overview.max_row):
-                cell = row[col_idx - 1] # Adjust for 0-indexed column in row tuple
-                try:
-                    if cell.value is not None:
-                        # Consider formatted numbers as well for length
-                        cell_value_str = str(cell.value)
-                        if isinstance(cell.value, (int, float)) and cell.number_format:
-                            # Attempt to get formatted string if number_format exists
-                            # This is a bit advanced for openpyxl, but simple str() is usually enough
-                            pass
-                        max_length = max(max_length, len(cell_value_str))
-                except Exception as e:
-                    print(f"Error checking cell length at {column_letter}{cell.row}: {e}")
-                    pass
-            adjusted_width = min(max_length + 2, 30) # Cap width to 30 for long strings
-            ws_market_overview.column_dimensions[column_letter].width = adjusted_width
+        for col_idx, width in enumerate(column_widths(market_overview_df), start=1):
+            ws_market_overview.column_dimensions[get_column_letter(col_idx)].width = width
 
     # 3. Global Metrics Sheet
     if global_metrics_df is not None and not global_metrics_df.empty:
-        ws_global_metrics = wb[GLOBAL_METRICS_SHEET_NAME]
-        ws_global_metrics.delete_rows(1, ws_global_metrics.max_row)
+        ws_global_metrics = recreate_sheet(wb, GLOBAL_METRICS_SHEET_NAME)
 
-        # Write header row
-        ws_global_metrics.append(global_metrics_df.columns.tolist())
+        write_dataframe(ws_global_metrics, global_metrics_df[['Metric', 'Value']]) # NaNs are saved as empty cells
 
-        # Write data rows (dataframe_to_rows handles NaNs properly as empty cells)
-        for r_idx, r in enumerate(dataframe_to_rows(global_metrics_df, index=False, header=False)):
-            for c_idx, value in enumerate(r):
-                ws_global_metrics.cell(row=r_idx + 2, column=c_idx + 1, value=value)
-
-        # Format header
-        for cell in ws_global_metrics[1]:
-            cell.font = Font(bold=True, color='FFFFFF')
-            cell.fill = PatternFill(start_color=COLORS['header'], end_color=COLORS['header'], fill_type='solid')
-
-        # Apply specific number formats based on the metric name
-        for row_idx in range(2, ws_global_metrics.max_row + 1):
-            metric_name = ws_global_metrics.cell(row=row_idx, column=1).value
-            value_cell = ws_global_metrics.cell(row=row_idx, column=2)
-
-            if pd.isna(value_cell.value): # Handle NaN values from DataFrame
+        # Apply specific number formats based on the metric name, read from the DataFrame
+        # rather than back from the sheet; only the Value column's cells are visited
+        metric_rows = global_metrics_df[['Metric', 'Value']].itertuples(index=False, name=None)
+        value_cells, = ws_global_metrics.iter_cols(min_col=2, max_col=2, min_row=2, max_row=len(global_metrics_df) + 1)
+        for (metric_name, value), value_cell in zip(metric_rows, value_cells):
+            if pd.isna(value): # Handle NaN values from DataFrame
                 continue
 
             if "USD" in str(metric_name): # Ensure metric_name is string
@@ -608,19 +846,10 @@ def create_or_update_excel(all_data, excel_file):
 
     # 4. Fear & Greed Index Sheet
     if fng_df is not None and not fng_df.empty:
-        ws_fng = wb[FEAR_GREED_INDEX_SHEET_NAME]
-        ws_fng.delete_rows(1, ws_fng.max_row)
-
-        # Write header row
-        ws_fng.append(fng_df.columns.tolist())
+        ws_fng = recreate_sheet(wb, FEAR_GREED_INDEX_SHEET_NAME)
 
-        for r_idx, r in enumerate(dataframe_to_rows(fng_df, index=False, header=False)): # header=False as we added it manually
-            for c_idx, value in enumerate(r):
-                ws_fng.cell(row=r_idx+2, column=c_idx+1, value=value) # Start from row 2 for data
+        write_dataframe(ws_fng, fng_df)
 
-        for cell in ws_fng[1]:
-            cell.font = Font(bold=True, color='FFFFFF')
-            cell.fill = PatternFill(start_color=COLORS['header'], end_color=COLORS['header'], fill_type='solid')
         ws_fng.column_dimensions['A'].width = 12
         ws_fng.column_dimensions['B'].width = 18
         ws_fng.column_dimensions['C'].width = 15
@@ -634,8 +863,9 @@ def create_or_update_excel(all_data, excel_file):
 
         # Corrected references for F&G chart (data starts from row 2 as headers are in row 1)
         # Data for chart should be numeric. 'Fear & Greed Index' column is B (2nd col)
-        data = Reference(ws_fng, min_col=2, min_row=1, max_row=ws_fng.max_row, max_col=2)
-        dates = Reference(ws_fng, min_col=1, min_row=2, max_row=ws_fng.max_row) # Date column is A (1st col)
+        fng_max_row = ws_fng.max_row
+        data = Reference(ws_fng, min_col=2, min_row=1, max_row=fng_max_row, max_col=2)
+        dates = Reference(ws_fng, min_col=1, min_row=2, max_row=fng_max_row) # Date column is A (1st col)
 
         chart.add_data(data, titles_from_data=True)
         chart.set_categories(dates)
@@ -646,52 +876,43 @@ def create_or_update_excel(all_data, excel_file):
     for symbol, hist_df in all_data.get('historical_data', {}).items():
         sheet_name = f"{symbol} History (1 Month)"
         if sheet_name in wb.sheetnames and hist_df is not None and not hist_df.empty:
-            ws_hist = wb[sheet_name]
-            ws_hist.delete_rows(1, ws_hist.max_row)
-
-            # Write header row
-            ws_hist.append(hist_df.columns.tolist())
-
-            for r_idx, r in enumerate(dataframe_to_rows(hist_df, index=False, header=False)): # header=False as we added it manually
-                for c_idx, value in enumerate(r):
-                    ws_hist.cell(row=r_idx+2, column=c_idx+1, value=value) # Start from row 2 for data
-
-            # Basic formatting for historical sheets
-            for cell in ws_hist[1]:
-                cell.font = Font(bold=True, color='FFFFFF')
-                cell.fill = PatternFill(start_color=COLORS['header'], end_color=COLORS['header'], fill_type='solid')
-
-            # Apply numeric formatting where appropriate
-            header_row_values = [cell.value for cell in ws_hist[1]]
-            for row_idx in range(2, ws_hist.max_row + 1):
-                for col_idx in range(1, ws_hist.max_column + 1):
-                    cell = ws_hist.cell(row=row_idx, column=col_idx)
-                    header_name = header_row_values[col_idx-1] # -1 for 0-indexed list
-
-                    if header_name == 'Price' or header_name.endswith('MA'):
-                        if cell.value is not None:
-                            cell.number_format = '#,##0.0000' # High precision for price/MA
-                    elif header_name == 'Volume' or header_name == 'Market Cap':
-                        if cell.value is not None:
-                            cell.number_format = '#,##0' # Integer formatting
-                    elif header_name == 'Daily Return (%)' or header_name == 'Volatility (7d)':
-                        if cell.value is not None:
-                            cell.number_format = '0.000%' # Percentage formatting
-
-
-            for col_idx in range(1, ws_hist.max_column + 1):
-                ws_hist.column_dimensions[get_column_letter(col_idx)].width = 15
+            ws_hist = recreate_sheet(wb, sheet_name)
+
+            write_dataframe(ws_hist, hist_df)
+            # max_row/max_column scan every cell on each access, so read them once per sheet
+            max_row, max_col = ws_hist.max_row, ws_hist.max_column
+            # 1-based sheet column of each header, looked up by the formatting, CF and chart code below
+            col_idx_map = {header_name: col_idx for col_idx, header_name in enumerate(hist_df.columns, start=1)}
+
+            # Map each formatted column to its named style once from the headers; Date and other
+            # unformatted columns are left out of the map, so their cells are never visited
+            column_styles = {}
+            for header_name, col_idx in col_idx_map.items():
+                style_name = history_style_name(header_name)
+                if style_name is not None:
+                    column_styles[col_idx] = style_name
+
+            for col_idx, style_name in column_styles.items():
+                column_cells, = ws_hist.iter_cols(min_col=col_idx, max_col=col_idx, min_row=2, max_row=max_row)
+                for cell in column_cells:
+                    if cell.value is not None:
+                        cell.style = style_name
+
+            # Column letters are resolved once per sheet and reused below
+            column_letters = [get_column_letter(col_idx) for col_idx in range(1, max_col + 1)]
+            for column_letter in column_letters:
+                ws_hist.column_dimensions[column_letter].width = 15
 
             # Conditional formatting for Daily Return (%)
-            # Assuming 'Daily Return (%)' is in column 5 (E) as per the original script
-            try:
-                return_col_idx = hist_df.columns.get_loc('Daily Return (%)') + 1 # +1 because openpyxl is 1-indexed
-                ws_hist.conditional_formatting.add(f'{get_column_letter(return_col_idx)}2:{get_column_letter(return_col_idx)}{ws_hist.max_row}', ColorScaleRule(
+            return_col_idx = col_idx_map.get('Daily Return (%)')
+            if return_col_idx:
+                return_col_letter = column_letters[return_col_idx - 1]
+                ws_hist.conditional_formatting.add(f'{return_col_letter}2:{return_col_letter}{max_row}', ColorScaleRule(
                     start_type='min', start_color='FFFF0000',
                     mid_type='num', mid_value=0, mid_color='FFFFFF00',
                     end_type='max', end_color='FF00FF00'
                 ))
-            except KeyError:
+            else:
                 print(f"Warning: 'Daily Return (%)' column not found for conditional formatting in {sheet_name}.")
 
 
@@ -703,11 +924,11 @@ def create_or_update_excel(all_data, excel_file):
             chart.y_axis.title = 'Price (USD)'
 
             # Data and categories for the chart
-            price_col_idx = hist_df.columns.get_loc('Price') + 1
+            price_col_idx = col_idx_map['Price']
             # Data should start from row 1 (header) for titles_from_data=True
-            data = Reference(ws_hist, min_col=price_col_idx, min_row=1, max_row=ws_hist.max_row, max_col=price_col_idx)
+            data = Reference(ws_hist, min_col=price_col_idx, min_row=1, max_row=max_row, max_col=price_col_idx)
             # Categories (dates) should start from row 2 (data)
-            dates = Reference(ws_hist, min_col=1, min_row=2, max_row=ws_hist.max_row) # Date column is 1
+            dates = Reference(ws_hist, min_col=1, min_row=2, max_row=max_row) # Date column is 1
 
             chart.add_data(data, titles_from_data=True)
             chart.set_categories(dates)
@@ -721,60 +942,42 @@ def create_or_update_excel(all_data, excel_file):
     # No dynamic data is fetched for transactions, only headers on creation.
     # We ensure existing data is not overwritten.
 
-    # Update for 'Current Portfolio' sheet (existing logic retained and adjusted for headers)
+    # Update for 'Current Portfolio' sheet
     current_portfolio_df = all_data.get('current_portfolio')
     if current_portfolio_df is not None and not current_portfolio_df.empty:
         ws_portfolio = wb[CURRENT_PORTFOLIO_SHEET_NAME]
 
-        header = [cell.value for cell in ws_portfolio[1]] if ws_portfolio.max_row > 0 else []
-        existing_portfolio_data = []
-        if ws_portfolio.max_row > 1:
-            for row in ws_portfolio.iter_rows(min_row=2, values_only=True):
-                existing_portfolio_data.append(dict(zip(header, row)))
-        existing_portfolio_df = pd.DataFrame(existing_portfolio_data)
-
-        if 'Coin ID' in existing_portfolio_df.columns:
-            existing_portfolio_df.set_index('Coin ID', inplace=True)
+        # Only the prices change, so write those cells in place and append rows for new coins;
+        # everything else the user keeps on this sheet (formulas, formatting, extra columns) is left untouched
+        header = [cell.value for cell in ws_portfolio[1]]
+        if 'Coin ID' not in header:
+            print(f"Warning: No 'Coin ID' column in '{CURRENT_PORTFOLIO_SHEET_NAME}'. Skipping portfolio price update.")
         else:
-            existing_portfolio_df = pd.DataFrame()
-
-        current_portfolio_df.set_index('Coin ID', inplace=True)
+            coin_col_idx = header.index('Coin ID') + 1
+            if 'Current Value (USD)' not in header:
+                header.append('Current Value (USD)')
+                header_cell = ws_portfolio.cell(row=1, column=len(header), value='Current Value (USD)')
+                header_cell.font = HEADER_FONT
+                header_cell.fill = HEADER_FILL
+            value_col_idx = header.index('Current Value (USD)') + 1
+
+            # Sheet row(s) of each coin, read from the Coin ID column alone
+            coin_rows = {}
+            for (coin_cell,) in ws_portfolio.iter_rows(min_row=2, min_col=coin_col_idx, max_col=coin_col_idx):
+                if coin_cell.value is not None:
+                    coin_rows.setdefault(coin_cell.value, []).append(coin_cell.row)
+
+            for coin_id, price in current_portfolio_df[['Coin ID', 'Current Value (USD)']].itertuples(index=False, name=None):
+                if coin_id in coin_rows:
+                    for row_idx in coin_rows[coin_id]:
+                        ws_portfolio.cell(row=row_idx, column=value_col_idx, value=price)
+                else:
+                    ws_portfolio.append({coin_col_idx: coin_id, value_col_idx: price})
 
-        merged_portfolio_df = existing_portfolio_df.copy()
-
-        for coin_id, row_api in current_portfolio_df.iterrows():
-            if coin_id in merged_portfolio_df.index:
-                merged_portfolio_df.loc[coin_id, 'Current Value (USD)'] = row_api['Current Value (USD)']
-            else:
-                new_coin_row = row_api.to_frame().T
-                new_coin_row.index.name = 'Coin ID'
-                merged_portfolio_df = pd.concat([merged_portfolio_df, new_coin_row])
-
-        portfolio_cols = ['Current Value (USD)', 'Symbol', 'Location', 'Quantity', 'Purchase Price (USD)', 'Total Value (USD)', 'P/L (USD)', 'P/L Ratio', 'Airdrop or Invest']
-        for col in portfolio_cols:
-            if col not in merged_portfolio_df.columns:
-                merged_portfolio_df[col] = ''
-
-        final_portfolio_cols = ['Coin ID'] + [col for col in portfolio_cols if col in merged_portfolio_df.columns]
-        merged_portfolio_df = merged_portfolio_df.reset_index()[final_portfolio_cols]
-
-        ws_portfolio.delete_rows(1, ws_portfolio.max_row)
-        for r_idx, r in enumerate(dataframe_to_rows(merged_portfolio_df, index=False, header=True)):
-            for c_idx, value in enumerate(r):
-                ws_portfolio.cell(row=r_idx+1, column=c_idx+1, value=value)
-        for col in range(1, ws_portfolio.max_column + 1):
-            ws_portfolio.column_dimensions[chr(64 + col)].width = 20
-        # Apply header styling to Current Portfolio
-        for cell in ws_portfolio[1]:
-            cell.font = Font(bold=True, color='FFFFFF')
-            cell.fill = PatternFill(start_color=COLORS['header'], end_color=COLORS['header'], fill_type='solid')
-
-    # Reorder sheets to your desired order
-    for i, sheet_name in enumerate(SHEET_ORDER):
-        if sheet_name in wb.sheetnames:
-            ws = wb[sheet_name]
-            if wb.sheetnames.index(sheet_name) != i:
-                wb.move_sheet(ws, offset=i - wb.sheetnames.index(sheet_name))
+    # Reorder sheets to your desired order with one stable sort; any extra sheets the user
+    # added keep their relative order after the known ones
+    sheet_positions = {sheet_name: i for i, sheet_name in enumerate(SHEET_ORDER)}
+    wb._sheets.sort(key=lambda ws: sheet_positions.get(ws.title, len(sheet_positions)))
 
     wb.save(excel_file)
     print("Excel file updated successfully with all sheets.")
@@ -787,8 +990,38 @@ if __name__ == "__main__": # Corrected __name__
     print("🚀 Starting comprehensive cryptocurrency data collection...")
     print("-" * 50)
 
-    print("Fetching current coin prices (for portfolio template 'Current Price' column if you want to integrate)...")
-    current_coin_prices = fetch_current_coin_prices(PORTFOLIO_COIN_IDS)
+    # openpyxl writes sheet XML through lxml's C serializer when it is installed,
+    # otherwise it falls back to a noticeably slower pure-Python writer
+    if not openpyxl.LXML:
+        print("ℹ️ lxml not found - Excel generation will be slower. Install it with: pip install lxml")
+
+    # Every endpoint is independent, so fetch them all concurrently. RATE_LIMITER caps the calls
+    # in flight and paces them per host, replacing the fixed sleeps between calls, so each
+    # fetch can have its own worker thread.
+    print("📡 Fetching current prices, market overview (Top 50 cryptos), global metrics and Fear & Greed Index...")
+    print(f"📅 Fetching {HISTORICAL_DAYS} days of historical data for selected coins...")
+    with ThreadPoolExecutor(max_workers=4 + len(HISTORY_COIN_IDS)) as executor:
+        prices_future = executor.submit(fetch_current_coin_prices, PORTFOLIO_COIN_IDS)
+        market_overview_future = executor.submit(get_market_overview)
+        global_metrics_future = executor.submit(get_global_metrics)
+        fng_future = executor.submit(get_fear_greed_index)
+        history_futures = {
+            executor.submit(get_historical_data, coin_id, HISTORICAL_DAYS): symbol
+            for symbol, coin_id in HISTORY_COIN_IDS.items()
+        }
+
+        # Report each history as soon as it lands instead of waiting for the whole batch
+        historical_dfs = {}
+        for future in as_completed(history_futures):
+            symbol = history_futures[future]
+            hist_df = future.result()
+            if hist_df is not None and not hist_df.empty:
+                historical_dfs[symbol] = hist_df
+                print(f"  ✅ Fetched history for {symbol} ({HISTORY_COIN_IDS[symbol]})")
+            else:
+                print(f"  ❌ Failed to fetch history for {symbol} ({HISTORY_COIN_IDS[symbol]})")
+
+    current_coin_prices = prices_future.result()
     if current_coin_prices:
         portfolio_df_data = []
         for coin_id, price in current_coin_prices.items():
@@ -801,48 +1034,29 @@ if __name__ == "__main__": # Corrected __name__
     else:
         print("Skipping Current Portfolio update due to fetch error.")
 
-    time.sleep(INITIAL_API_CALL_DELAY_SECONDS) # Delay before next major API call
-
-    print("📈 Collecting market overview data (Top 50 cryptos)...")
-    market_overview_df = get_market_overview()
+    market_overview_df = market_overview_future.result()
     if not market_overview_df.empty:
         all_fetched_data['market_overview'] = market_overview_df
         print(f"✅ Fetched market data for {len(market_overview_df)} cryptocurrencies.")
     else:
         print("❌ Failed to fetch market overview data.")
 
-    time.sleep(INITIAL_API_CALL_DELAY_SECONDS)
-
-    print("🌍 Collecting global market metrics...")
-    global_metrics_df = get_global_metrics()
+    global_metrics_df = global_metrics_future.result()
     if not global_metrics_df.empty:
         all_fetched_data['global_metrics'] = global_metrics_df
         print("✅ Fetched global market metrics.")
     else:
         print("❌ Failed to fetch global metrics.")
 
-    time.sleep(INITIAL_API_CALL_DELAY_SECONDS) # Corrected variable name
-
-    print("😰 Fetching Fear & Greed Index...")
-    fng_df = get_fear_greed_index()
+    fng_df = fng_future.result()
     if not fng_df.empty:
         all_fetched_data['fear_greed_index'] = fng_df
         print(f"✅ Fetched {len(fng_df)} days of Fear & Greed Index data.")
     else:
         print("❌ Failed to fetch Fear & Greed Index.")
 
-    print(f"Fetching {HISTORICAL_DAYS} days of historical data for selected coins...")
-    historical_dfs = {}
-    for symbol, coin_id in HISTORY_COIN_IDS.items():
-        hist_df = get_historical_data(coin_id, HISTORICAL_DAYS)
-        if hist_df is not None and not hist_df.empty:
-            historical_dfs[symbol] = hist_df
-            print(f"  ✅ Fetched history for {symbol} ({coin_id})")
-        else:
-            print(f"  ❌ Failed to fetch history for {symbol} ({coin_id})")
-        time.sleep(INITIAL_API_CALL_DELAY_SECONDS) # Delay after each historical API call
-
-    all_fetched_data['historical_data'] = historical_dfs
+    # Completion order is arbitrary, so put the histories back in HISTORY_COIN_IDS order
+    all_fetched_data['historical_data'] = {symbol: historical_dfs[symbol] for symbol in HISTORY_COIN_IDS if symbol in historical_dfs}
 
 
     print("\nAll data collection attempts complete. Proceeding to Excel generation...")
@@ -852,6 +1066,8 @@ if __name__ == "__main__": # Corrected __name__
     else:
         print("No data fetched. Excel file not updated.")
 
+    HTTP_SESSION.close()
+
     print("\n" + "=" * 50)
     print("📊 EXCEL FILE CONTENTS:")
     print("=" * 50)